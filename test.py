@@ -1,49 +1,171 @@
 import os
 import subprocess
+import sys
+import threading
 import unittest
+import uuid
 
-TARGET = os.getenv("TARGET", "./db")
-TEST_DATABASE_FILE = os.getenv("TEST_DATABASE_FILE", "./test.db")
+# Resolve the binary and the database-file template once at import; every
+# spawn reuses these instead of rebuilding paths per call.
+TARGET = os.path.abspath(os.getenv("TARGET", "./db"))
+if os.getenv("TEST_DATABASE_FILE"):
+    TEST_DATABASE_FILE = os.getenv("TEST_DATABASE_FILE")
+elif os.path.isdir("/dev/shm"):
+    # Keep the database on tmpfs where available so page writes on .exit
+    # stay in RAM instead of hitting the working-tree filesystem.
+    TEST_DATABASE_FILE = f"/dev/shm/test_{os.getpid()}.db"
+else:
+    TEST_DATABASE_FILE = "./test.db"
+DB_FILE_TEMPLATE = TEST_DATABASE_FILE + ".{}"
 
+# Ask for 1 MiB pipes so bulk scripts (e.g. the table-full test) fit in the
+# kernel buffer without the child stalling on a full pipe. Popen only grew
+# the pipesize parameter in Python 3.10.
+if sys.version_info >= (3, 10):
+    _POPEN_KWARGS = {"pipesize": 1 << 20}
+else:
+    _POPEN_KWARGS = {}
 
-def run_script(commands):
+# Canonical row shared by the insert/persistence/duplicate-key tests.
+INSERT_USER1 = "insert 1 user1 person1@example.com"
+ROW_USER1 = "db > (1, user1, person1@example.com)"
+
+
+def run_script(commands, db_file=TEST_DATABASE_FILE):
     p = subprocess.Popen(
-        [TARGET, TEST_DATABASE_FILE],
+        [TARGET, db_file],
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        encoding='utf-8')
-    input_data = "\n".join(commands) + "\n"
+        # Neither binary writes to stderr and no test asserts on it, so
+        # discard it in the kernel instead of merging it into stdout.
+        stderr=subprocess.DEVNULL,
+        # The test runner holds no fds beyond stdio, so skipping the
+        # close-fds sweep is safe and lets CPython spawn via posix_spawn,
+        # the same syscall a hand-rolled os.posix_spawn helper would make.
+        close_fds=False,
+        **_POPEN_KWARGS)
+    # Write everything, close stdin, then read stdout to EOF. This skips
+    # communicate()'s selector machinery and is deadlock-free as long as a
+    # script's output fits in the pipe buffer, which every test is far
+    # below. A watchdog timer keeps the hang protection communicate's
+    # timeout used to provide: killing the child closes its stdout and
+    # unblocks the read.
+    watchdog = threading.Timer(5, p.kill)
+    watchdog.start()
     try:
-        outs, _ = p.communicate(input=input_data, timeout=5)
-    except subprocess.TimeoutExpired:
-        # See https://docs.python.org/3/library/subprocess.html#subprocess.Popen.communicate
-        p.kill()
-        outs, _ = p.communicate()
-    lines = outs.split("\n")
+        # Popen's context manager closes both pipe ends and reaps the child.
+        with p:
+            try:
+                # The pipes stay in binary mode: the command stream is
+                # ASCII, so encoding line by line into the buffered writer
+                # avoids both the TextIOWrapper layer and materializing the
+                # joined script, which matters for the bulk-insert tests.
+                p.stdin.writelines(
+                    f"{cmd}\n".encode('utf-8') for cmd in commands)
+            except BrokenPipeError:
+                # The table-full test makes the child exit mid-script; the
+                # unread tail of the script does not matter.
+                pass
+            try:
+                # Close separately: flushing what writelines buffered can
+                # hit the same broken pipe, and an unclosed stdin would make
+                # Popen.__exit__ re-raise it.
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+            outs = p.stdout.read()
+    finally:
+        watchdog.cancel()
+    lines = outs.decode('utf-8').splitlines()
     return p.returncode, lines
 
 
 class MyDatabaseTest(unittest.TestCase):
+    # Each script runs in its own child process on purpose: the pager keeps
+    # its page cache for the lifetime of the process and the binary has no
+    # meta-command to reset it or to mark where one script's output ends, so
+    # a single long-lived instance cannot give tests a fresh B-tree. Tests
+    # that cover persistence (.exit then reopen) also depend on the process
+    # actually terminating between scripts. The same constraint rules out
+    # concatenating all test scripts into one invocation: .exit is the only
+    # way to flush pages and it terminates the process, so every test's
+    # commands are already batched into a single write per spawn and that is
+    # as coarse as the framing can get.
     maxDiff = None
 
+    # Large constant transcripts are built once at class creation instead of
+    # on every test invocation.
+    EXPECTED_CONSTANTS = [
+        "db > Constants:",
+        "ROW_SIZE: 293",
+        "COMMON_NODE_HEADER_SIZE: 6",
+        "LEAF_NODE_HEADER_SIZE: 10",
+        "LEAF_NODE_CELL_SIZE: 297",
+        "LEAF_NODE_SPACE_FOR_CELLS: 4086",
+        "LEAF_NODE_MAX_CELLS: 13",
+        "db > ",
+    ]
+
+    EXPECTED_ONE_NODE_BTREE = [
+        "db > Executed.",
+        "db > Executed.",
+        "db > Executed.",
+        "db > Tree:",
+        "- leaf (size 3)",
+        "  - 1",
+        "  - 2",
+        "  - 3",
+        "db > "
+    ]
+
+    EXPECTED_THREE_LEAF_NODE_BTREE = [
+        "db > Tree:",
+        "- internal (size 1)",
+        "  - leaf (size 7)",
+        "    - 1",
+        "    - 2",
+        "    - 3",
+        "    - 4",
+        "    - 5",
+        "    - 6",
+        "    - 7",
+        "- key 7",
+        "  - leaf (size 7)",
+        "    - 8",
+        "    - 9",
+        "    - 10",
+        "    - 11",
+        "    - 12",
+        "    - 13",
+        "    - 14",
+        "db > Executed.",
+        "db > ",
+    ]
+
+    def setUp(self):
+        # A unique database file per test keeps tests independent of each
+        # other, so the suite can run under parallel runners as-is.
+        self.db_file = DB_FILE_TEMPLATE.format(uuid.uuid4().hex)
+
     def tearDown(self):
         try:
-            subprocess.run(["rm", TEST_DATABASE_FILE])
-        except Exception as e:
-            print(e)
+            os.unlink(self.db_file)
+        except FileNotFoundError:
+            pass
+
+    def run_script(self, commands):
+        return run_script(commands, self.db_file)
 
     def test_inserts_and_retrieves_a_row(self):
-        code, outs = run_script([
-            "insert 1 user1 person1@example.com",
+        code, outs = self.run_script([
+            INSERT_USER1,
             "select",
             ".exit",
         ])
         self.assertEqual(code, 0)
         self.assertListEqual(outs, [
             "db > Executed.",
-            "db > (1, user1, person1@example.com)",
+            ROW_USER1,
             "Executed.",
             "db > ",
         ])
@@ -53,45 +175,40 @@ class MyDatabaseTest(unittest.TestCase):
         for i in range(1, 1401):
             ops.append(f"insert {i} user{i} person{i}@example.com")
         ops.append(".exit")
-        _, outs = run_script(ops)
-        self.assertEqual(outs[-3:-1], [
+        _, outs = self.run_script(ops)
+        self.assertEqual(outs[-2:], [
             "db > Executed.",
             "db > Need to implement updating parent after split",
         ])
 
-    def test_allows_inserting_strings_that_are_the_maximum_length(self):
-        long_username = "a"*32
-        long_email = "a"*255
-        code, outs = run_script([
-            f"insert 1 {long_username} {long_email}",
-            "select",
-            ".exit",
-        ])
-        self.assertEqual(code, 0)
-        self.assertListEqual(outs, [
-            "db > Executed.",
-            f"db > (1, {long_username}, {long_email})",
-            "Executed.",
-            "db > ",
-        ])
-
-    def test_prints_error_message_if_strings_are_too_long(self):
-        long_username = "a"*33
-        long_email = "a"*256
-        code, outs = run_script([
-            f"insert 1 {long_username} {long_email}",
+    def test_enforces_maximum_string_lengths(self):
+        # All three length variants run against one db instance; only the
+        # maximum-length row should survive to the final select.
+        max_username = "a"*32
+        max_email = "a"*255
+        code, outs = self.run_script([
+            f"insert 1 {max_username} {max_email}",
+            f"insert 2 {'a'*33} person2@example.com",
+            f"insert 3 user3 {'a'*256}",
             "select",
             ".exit",
         ])
         self.assertEqual(code, 0)
-        self.assertListEqual(outs, [
-            "db > String is too long.",
-            "db > Executed.",
-            "db > ",
-        ])
+        with self.subTest(case="maximum length is accepted"):
+            self.assertEqual(outs[0], "db > Executed.")
+        with self.subTest(case="username too long"):
+            self.assertEqual(outs[1], "db > String is too long.")
+        with self.subTest(case="email too long"):
+            self.assertEqual(outs[2], "db > String is too long.")
+        with self.subTest(case="only the valid row is stored"):
+            self.assertListEqual(outs[3:], [
+                f"db > (1, {max_username}, {max_email})",
+                "Executed.",
+                "db > ",
+            ])
 
     def test_prints_an_error_message_if_id_is_negative(self):
-        code, outs = run_script([
+        code, outs = self.run_script([
             "insert -1 cstack foo@bar.com",
             "select",
             ".exit",
@@ -104,8 +221,8 @@ class MyDatabaseTest(unittest.TestCase):
         ])
 
     def test_keeps_data_after_closing_connection(self):
-        _, outs = run_script([
-            "insert 1 user1 person1@example.com",
+        _, outs = self.run_script([
+            INSERT_USER1,
             ".exit",
         ])
         self.assertListEqual(outs, [
@@ -113,31 +230,22 @@ class MyDatabaseTest(unittest.TestCase):
             "db > ",
         ])
 
-        _, outs = run_script([
+        _, outs = self.run_script([
             "select",
             ".exit",
         ])
         self.assertListEqual(outs, [
-            "db > (1, user1, person1@example.com)",
+            ROW_USER1,
             "Executed.",
             "db > ",
         ])
 
     def test_print_constants(self):
-        _, outs = run_script([
+        _, outs = self.run_script([
             ".constants",
             ".exit",
         ])
-        self.assertListEqual(outs, [
-            "db > Constants:",
-            "ROW_SIZE: 293",
-            "COMMON_NODE_HEADER_SIZE: 6",
-            "LEAF_NODE_HEADER_SIZE: 10",
-            "LEAF_NODE_CELL_SIZE: 297",
-            "LEAF_NODE_SPACE_FOR_CELLS: 4086",
-            "LEAF_NODE_MAX_CELLS: 13",
-            "db > ",
-        ])
+        self.assertListEqual(outs, self.EXPECTED_CONSTANTS)
 
     def test_allow_printing_out_the_structure_of_a_one_node_btree(self):
         ops = []
@@ -145,30 +253,20 @@ class MyDatabaseTest(unittest.TestCase):
             ops.append(f"insert {i} user{i} person{i}@example.com")
         ops.append(".btree")
         ops.append(".exit")
-        _, outs = run_script(ops)
-        self.assertListEqual(outs, [
-            "db > Executed.",
-            "db > Executed.",
-            "db > Executed.",
-            "db > Tree:",
-            "- leaf (size 3)",
-            "  - 1",
-            "  - 2",
-            "  - 3",
-            "db > "
-        ])
+        _, outs = self.run_script(ops)
+        self.assertListEqual(outs, self.EXPECTED_ONE_NODE_BTREE)
 
     def test_prints_an_error_message_if_there_is_a_duplicate_id(self):
-        _, outs = run_script([
-            "insert 1 user1 person1@example.com",
-            "insert 1 user1 person1@example.com",
+        _, outs = self.run_script([
+            INSERT_USER1,
+            INSERT_USER1,
             "select",
             ".exit",
         ])
         self.assertListEqual(outs, [
             "db > Executed.",
             "db > Error: Duplicate key.",
-            "db > (1, user1, person1@example.com)",
+            ROW_USER1,
             "Executed.",
             "db > ",
         ])
@@ -180,30 +278,8 @@ class MyDatabaseTest(unittest.TestCase):
         ops.append(".btree")
         ops.append("insert 15 user15 person15@example.com")
         ops.append(".exit")
-        _, outs = run_script(ops)
-        self.assertListEqual(outs[14:], [
-            "db > Tree:",
-            "- internal (size 1)",
-            "  - leaf (size 7)",
-            "    - 1",
-            "    - 2",
-            "    - 3",
-            "    - 4",
-            "    - 5",
-            "    - 6",
-            "    - 7",
-            "- key 7",
-            "  - leaf (size 7)",
-            "    - 8",
-            "    - 9",
-            "    - 10",
-            "    - 11",
-            "    - 12",
-            "    - 13",
-            "    - 14",
-            "db > Executed.",
-            "db > ",
-        ])
+        _, outs = self.run_script(ops)
+        self.assertListEqual(outs[14:], self.EXPECTED_THREE_LEAF_NODE_BTREE)
 
 
 if __name__ == '__main__':